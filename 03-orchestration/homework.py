@@ -1,7 +1,6 @@
 from datetime import date
 from pathlib import Path
 
-import pandas as pd
 from prefect import flow, task
 from prefect.artifacts import create_markdown_artifact
 from prefect_aws import S3Bucket
@@ -10,22 +9,38 @@ from sklearn.metrics import mean_squared_error
 from sklearn.pipeline import Pipeline
 from xgboost import XGBRegressor
 
-from src import create_pipeline, process_trips, read_trips, save_model
+from src import (
+    PROCESS_TRIPS_COLS,
+    create_pipeline,
+    download_trips,
+    process_trips,
+    read_compact_trips,
+    read_intermediate,
+    release_intermediate,
+    save_model,
+    write_intermediate,
+)
 
 DATA_FOLDER = "data"
 MODEL_FOLDER = "models"
 
 
 @task(retries=3, retry_delay_seconds=2, name="Read taxi trips data")
-def read_trips_task(
-    data_folder: str, color: str, year: str, month: str
-) -> pd.DataFrame:
-    return read_trips(data_folder, color, year, month)
+def read_trips_task(data_folder: str, color: str, year: str, month: str) -> Path:
+    return download_trips(Path(data_folder), color, year, month)
 
 
 @task()
-def process_trips_task(trips: pd.DataFrame) -> pd.DataFrame:
-    return process_trips(trips)
+def process_trips_task(
+    trips_path: Path, used_cols: list[str], data_folder: str
+) -> Path:
+    trips = read_compact_trips(trips_path, columns=PROCESS_TRIPS_COLS + used_cols)
+    trips = process_trips(trips)
+    return write_intermediate(
+        trips[used_cols],
+        folder=Path(data_folder) / "intermediate",
+        name=trips_path.stem,
+    )
 
 
 @task(log_prints=True)
@@ -66,34 +81,42 @@ def main_flow_hw(
     trips_train = read_trips_task(data_folder, *train_data)
     trips_val = read_trips_task(data_folder, *val_data)
 
-    trips_train = process_trips_task(trips_train)
-    trips_val = process_trips_task(trips_val)
-
     target = "duration"
     categorical_cols = ["PU_DO"]
     numerical_cols = ["trip_distance"]
     used_cols = categorical_cols + numerical_cols
 
-    X_train = trips_train[used_cols]
-    y_train = trips_train[target]
-
-    X_val = trips_val[used_cols]
-    y_val = trips_val[target]
-
-    model_params = {
-        "learning_rate": 0.09585355369315604,
-        "max_depth": 30,
-        "min_child_weight": 1.060597050922164,
-        "objective": "reg:linear",
-        "reg_alpha": 0.018060244040060163,
-        "reg_lambda": 0.011658731377413597,
-        "seed": 42,
-    }
-    xgb_regressor = XGBRegressor(**model_params)
-    model = create_pipeline(xgb_regressor)
-
-    model.fit(X_train, y_train)
-    rmse = mean_squared_error(y_val, model.predict(X_val), squared=False)
+    # Intermediates are released in the finally block, so that failed runs do
+    # not leave them behind in the intermediate folder.
+    intermediates = []
+    try:
+        trips_train = process_trips_task(trips_train, used_cols + [target], data_folder)
+        intermediates.append(trips_train)
+        trips_val = process_trips_task(trips_val, used_cols + [target], data_folder)
+        intermediates.append(trips_val)
+
+        model_params = {
+            "learning_rate": 0.09585355369315604,
+            "max_depth": 30,
+            "min_child_weight": 1.060597050922164,
+            "objective": "reg:linear",
+            "reg_alpha": 0.018060244040060163,
+            "reg_lambda": 0.011658731377413597,
+            "seed": 42,
+        }
+        xgb_regressor = XGBRegressor(**model_params)
+        model = create_pipeline(xgb_regressor)
+
+        trips = read_intermediate(trips_train)
+        model.fit(trips[used_cols], trips[target])
+
+        trips = read_intermediate(trips_val)
+        rmse = mean_squared_error(
+            trips[target], model.predict(trips[used_cols]), squared=False
+        )
+        del trips
+    finally:
+        release_intermediate(*intermediates)
 
     save_best_model_task(MODEL_FOLDER, "xgbregressor.pkl", model)
     markdown_task(rmse)
@@ -1,45 +1,66 @@
 from datetime import date
 from pathlib import Path
 
-import pandas as pd
 from prefect import flow, task
 from prefect.artifacts import create_markdown_artifact
 from prefect_aws import S3Bucket
 from prefect_email import EmailServerCredentials, email_send_message
-from sklearn.pipeline import Pipeline
 
-from src import process_trips, read_trips, save_model, train_best_xgbregressor
+from src import (
+    PROCESS_TRIPS_COLS,
+    download_trips,
+    process_trips,
+    read_compact_trips,
+    read_intermediate,
+    release_intermediate,
+    save_model,
+    train_best_xgbregressor,
+    write_intermediate,
+)
 
 DATA_FOLDER = "data"
 MODEL_FOLDER = "models"
 
 
 @task(retries=3, retry_delay_seconds=2, name="Read taxi trips data")
-def read_trips_task(
-    data_folder: str, color: str, year: str, month: str
-) -> pd.DataFrame:
-    return read_trips(data_folder, color, year, month)
+def read_trips_task(data_folder: str, color: str, year: str, month: str) -> Path:
+    return download_trips(Path(data_folder), color, year, month)
 
 
 @task()
-def process_trips_task(trips: pd.DataFrame) -> pd.DataFrame:
-    return process_trips(trips)
+def process_trips_task(
+    trips_path: Path, used_cols: list[str], data_folder: str
+) -> Path:
+    trips = read_compact_trips(trips_path, columns=PROCESS_TRIPS_COLS + used_cols)
+    trips = process_trips(trips)
+    return write_intermediate(
+        trips[used_cols],
+        folder=Path(data_folder) / "intermediate",
+        name=trips_path.stem,
+    )
 
 
 @task(log_prints=True)
 def train_best_xgbregressor_task(
-    X_train: pd.DataFrame,
-    y_train: pd.Series,
-    X_val: pd.DataFrame,
-    y_val: pd.Series,
-) -> pd.DataFrame:
-    return train_best_xgbregressor(X_train, y_train, X_val, y_val)
-
+    train_path: Path,
+    val_path: Path,
+    used_cols: list[str],
+    target: str,
+    model_path: str,
+    model_name: str,
+) -> tuple[Path, float]:
+    trips_train = read_intermediate(train_path)
+    trips_val = read_intermediate(val_path)
+
+    best_model, rmse = train_best_xgbregressor(
+        trips_train[used_cols],
+        trips_train[target],
+        trips_val[used_cols],
+        trips_val[target],
+    )
+    save_model(Path(model_path), model_name, best_model)
 
-@task(log_prints=True)
-def save_best_model_task(path: str, model_name: str, pipe: Pipeline) -> None:
-    path = Path(path)
-    save_model(path, model_name, pipe)
+    return Path(model_path) / model_name, rmse
 
 
 @task()
@@ -74,22 +95,26 @@ def main_flow(
     trips_train = read_trips_task(data_folder, *train_data)
     trips_val = read_trips_task(data_folder, *val_data)
 
-    trips_train = process_trips_task(trips_train)
-    trips_val = process_trips_task(trips_val)
-
     target = "duration"
     categorical_cols = ["PU_DO"]
     numerical_cols = ["trip_distance"]
     used_cols = categorical_cols + numerical_cols
 
-    X_train = trips_train[used_cols]
-    y_train = trips_train[target]
-
-    X_val = trips_val[used_cols]
-    y_val = trips_val[target]
+    # Intermediates are released in the finally block, so that failed runs do
+    # not leave them behind in the intermediate folder.
+    intermediates = []
+    try:
+        trips_train = process_trips_task(trips_train, used_cols + [target], data_folder)
+        intermediates.append(trips_train)
+        trips_val = process_trips_task(trips_val, used_cols + [target], data_folder)
+        intermediates.append(trips_val)
+
+        _, rmse = train_best_xgbregressor_task(
+            trips_train, trips_val, used_cols, target, MODEL_FOLDER, "xgbregressor.pkl"
+        )
+    finally:
+        release_intermediate(*intermediates)
 
-    best_model, rmse = train_best_xgbregressor_task(X_train, y_train, X_val, y_val)
-    save_best_model_task(MODEL_FOLDER, "xgbregressor.pkl", best_model)
     markdown_task(rmse)
 
     email_server_credentials = EmailServerCredentials.load(
@@ -1,29 +1,86 @@
+import hashlib
+import logging
+import os
 import pickle
+import threading
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import wget
 from flask import Flask, jsonify, request
+from prediction_cache import PredictionCache
+from shadow_scoring import (
+    FeatureBatch,
+    ShadowRunner,
+    choose_variant,
+    parse_shadow_models,
+)
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.feature_extraction import DictVectorizer
 from waitress import serve
 
 DATA_FOLDER = "data"
+MODEL_PATH = "model.bin"
 FEATURE_COLS = ["PULocationID", "DOLocationID"]
+TRIP_COLS = [
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    *FEATURE_COLS,
+    "trip_distance",
+]
+# Same categories as LOCATION_DTYPE in src/schema.py (the image is built from
+# this folder only): "-1" for missing locations and the TLC zones 1-265, so
+# that the category code of a zone is the zone number.
+LOCATION_DTYPE = pd.CategoricalDtype(["-1", *map(str, range(1, 266))])
+PRIMARY_MODEL = "primary"
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "0")) or None
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH")
+# Set to 0 to always recompute whole jobs, e.g. when load testing the scoring.
+JOB_CACHE_ENABLED = os.getenv("JOB_CACHE_ENABLED", "1") != "0"
+
+# Comma-separated name=path pairs, e.g. "xgb=../models/xgbregressor.pkl". The
+# first one is the challenger that serves AB_TRAFFIC_SHARE of the jobs.
+# Pipelines from src.create_pipeline need the repo's src package to unpickle,
+# which the image does not ship: in the image, use (DictVectorizer, model)
+# tuples like model.bin.
+SHADOW_MODELS = os.getenv("SHADOW_MODELS", "")
+AB_TRAFFIC_SHARE = float(os.getenv("AB_TRAFFIC_SHARE", "0"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "4"))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
+)
 
 TLC_TRIP_DATA_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data/"
 
 
-def read_trips(data_folder: Path, color: str, year: str, month: str) -> pd.DataFrame:
+def trips_path(data_folder: Path, color: str, year: str, month: str) -> Path:
+    return data_folder / f"{color}_tripdata_{year}-{month:>02}.parquet"
+
+
+def read_trips(
+    data_folder: Path,
+    color: str,
+    year: str,
+    month: str,
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
     if not data_folder.exists():
         data_folder.mkdir(parents=True, exist_ok=True)
 
-    data_path = data_folder / f"{color}_tripdata_{year}-{month:>02}.parquet"
+    data_path = trips_path(data_folder, color, year, month)
     if not data_path.exists():
         url = f"{TLC_TRIP_DATA_URL}{color}_tripdata_{year}-{month:>02}.parquet"
         wget.download(url, str(data_path))
 
-    return pd.read_parquet(data_path)
+    return pd.read_parquet(data_path, columns=columns)
 
 
 def process_trips(trips: pd.DataFrame, trips_params: dict) -> pd.DataFrame:
@@ -32,46 +89,172 @@ def process_trips(trips: pd.DataFrame, trips_params: dict) -> pd.DataFrame:
 
     trips = trips[(trips["duration"] >= 1) & (trips["duration"] <= 60)].copy()
 
-    trips[FEATURE_COLS] = trips[FEATURE_COLS].fillna(-1).astype("int").astype("str")
-    trips[
-        "ride_id"
-    ] = f'{trips_params["year"]:>04}/{trips_params["month"]:>02}_' + trips.index.astype(
-        "str"
-    )
+    for col in FEATURE_COLS:
+        ids = trips[col].fillna(-1).to_numpy(dtype="int16")
+        codes = np.where((ids >= 1) & (ids <= 265), ids, 0)
+        trips[col] = pd.Categorical.from_codes(codes, dtype=LOCATION_DTYPE)
 
     return trips
 
 
+def build_ride_ids(index: pd.Index, trips_params: dict) -> pa.Array:
+    prefix = f'{trips_params["year"]:>04}/{trips_params["month"]:>02}_'
+    rows = pc.cast(pa.array(index.to_numpy()), pa.string())
+    return pc.binary_join_element_wise(prefix, rows, "")
+
+
+def shadow_features(trips: pd.DataFrame) -> pd.DataFrame:
+    # Union of the features of all models: the primary model uses the location
+    # IDs, pipelines from src.train_best_model use PU_DO and trip_distance.
+    # PU_DO labels are built for the distinct pairs only, as in src/schema.py.
+    # Code 0 holds missing and out-of-range zones here, which
+    # src.combine_locations labels "nan", so the pipelines see the same labels
+    # as in training.
+    labels = LOCATION_DTYPE.categories.to_numpy(dtype="object")
+    labels[0] = "nan"
+    n_labels = len(labels)
+    codes, pairs = pd.factorize(
+        trips["PULocationID"].cat.codes.to_numpy(dtype="int32") * n_labels
+        + trips["DOLocationID"].cat.codes.to_numpy(dtype="int32")
+    )
+    pu_do = pd.Categorical.from_codes(
+        codes, categories=labels[pairs // n_labels] + "_" + labels[pairs % n_labels]
+    )
+    return trips[FEATURE_COLS + ["trip_distance"]].assign(PU_DO=pu_do)
+
+
+def predictions_file_name(
+    trips_params: dict, shadow_model: Optional[str] = None
+) -> str:
+    suffix = f"_{shadow_model}" if shadow_model else ""
+    return (
+        f'{trips_params["color"]}_tripdata_{trips_params["year"]}_'
+        f'{trips_params["month"]}_preds{suffix}.parquet'
+    )
+
+
 def save_predictions(
-    trips: pd.DataFrame, data_folder: Path, trips_params: dict
+    ride_ids: pa.Array,
+    y_pred: np.ndarray,
+    data_folder: Path,
+    trips_params: dict,
+    compression: Optional[str] = None,
+    row_group_size: Optional[int] = None,
+    model_name: str = PRIMARY_MODEL,
+    shadow: bool = False,
 ) -> None:
-    file_name = (
-        f'{trips_params["color"]}_tripdata_{trips_params["year"]}_'
-        f'{trips_params["month"]}_preds.parquet'
+    # The model column is dictionary-encoded, so it costs next to nothing.
+    model = pa.DictionaryArray.from_arrays(
+        pa.array(np.zeros(len(y_pred), dtype="int8")), pa.array([model_name])
     )
-    trips.to_parquet(
-        data_folder / file_name,
-        engine="pyarrow",
-        compression=None,
-        index=False,
+    predictions = pa.table({"ride_id": ride_ids, "pred": y_pred, "model": model})
+    pq.write_table(
+        predictions,
+        data_folder
+        / predictions_file_name(trips_params, model_name if shadow else None),
+        compression=compression,
+        row_group_size=row_group_size,
     )
 
 
-def load_model() -> tuple[DictVectorizer, RandomForestRegressor]:
-    with open("model.bin", "rb") as f:
-        dv, model = pickle.load(f)
-    return dv, model
+def load_model() -> tuple[str, DictVectorizer, RandomForestRegressor]:
+    # The version is the hash of the very bytes that are unpickled, so that a
+    # model.bin replaced in between cannot be cached under the wrong version.
+    with open(MODEL_PATH, "rb") as f:
+        model_bytes = f.read()
+    dv, model = pickle.loads(model_bytes)
+    return hashlib.sha256(model_bytes).hexdigest()[:16], dv, model
+
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=PREDICTION_CACHE_TTL,
+    backend_path=PREDICTION_CACHE_PATH,
+)
+# Results of whole jobs, kept apart (also in their own SQLite table) so that
+# their hits do not skew the hit ratio of the per-feature cache.
+job_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=PREDICTION_CACHE_TTL,
+    backend_path=PREDICTION_CACHE_PATH,
+    backend_table="jobs",
+)
+_model_lock = threading.Lock()
+_model_state = {"mtime_ns": None}
+
+
+def get_model() -> tuple[str, DictVectorizer, RandomForestRegressor]:
+    # Reload the model only when model.bin changes, and drop the cached
+    # predictions of the previous model at the same time.
+    with _model_lock:
+        mtime_ns = os.stat(MODEL_PATH).st_mtime_ns
+        if _model_state["mtime_ns"] != mtime_ns:
+            _model_state.update(
+                zip(["version", "dv", "model"], load_model()),
+                mtime_ns=mtime_ns,
+            )
+            prediction_cache.invalidate(_model_state["version"])
+            job_cache.invalidate(_model_state["version"])
+        return _model_state["version"], _model_state["dv"], _model_state["model"]
 
 
-def predict(features: pd.DataFrame) -> pd.Series:
-    dv, model = load_model()
+def job_result_key(job_key: tuple, data_path: Path) -> tuple:
+    # A cached result is only valid for the same version of the input month.
+    # The key starts with the model version, as cache keys must.
+    stat = data_path.stat()
+    return (*job_key[1:], stat.st_size, stat.st_mtime_ns)
 
-    features_dict = features.to_dict(orient="records")
-    X = dv.transform(features_dict)
-    y_pred = model.predict(X)
+
+def predict(features: pd.DataFrame) -> np.ndarray:
+    version, dv, model = get_model()
+
+    # Predict each distinct feature tuple once, and only if it is not cached.
+    unique_features = features.drop_duplicates()
+    codes = (
+        features.groupby(list(features.columns), sort=False, observed=True)
+        .ngroup()
+        .to_numpy()
+    )
+    keys = [(version, *values) for values in unique_features.itertuples(index=False)]
+    cached = prediction_cache.get_many(keys)
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        features_dict = unique_features.iloc[missing].to_dict(orient="records")
+        X = dv.transform(features_dict)
+        predicted = dict(zip([keys[i] for i in missing], model.predict(X)))
+        prediction_cache.set_many(predicted)
+        cached.update(predicted)
+
+    y_pred = np.array([cached[key] for key in keys])[codes]
     return y_pred
 
 
+shadow_models = parse_shadow_models(SHADOW_MODELS)
+challenger = next(iter(shadow_models), None)
+shadow_runner = ShadowRunner(max_pending=SHADOW_MAX_PENDING)
+
+
+def score_primary(batch: FeatureBatch) -> np.ndarray:
+    return predict(batch.features[FEATURE_COLS])
+
+
+def submit_shadows(
+    batch: FeatureBatch, ride_ids: pa.Array, trips_params: dict, served_model: str
+) -> None:
+    scorers = {PRIMARY_MODEL: score_primary, **shadow_models}
+    del scorers[served_model]
+    data_folder = Path(DATA_FOLDER)
+
+    shadow_runner.submit(
+        scorers,
+        batch,
+        lambda name, y_pred: save_predictions(
+            ride_ids, y_pred, data_folder, trips_params, model_name=name, shadow=True
+        ),
+    )
+
+
 app = Flask("duration-predictor")
 
 
@@ -79,24 +262,62 @@ app = Flask("duration-predictor")
 def predict_endpoint():
     trips_params = request.get_json()
 
+    version, _, _ = get_model()
+    job_key = ("job", version, *(trips_params[k] for k in ["color", "year", "month"]))
+    data_path = trips_path(Path(DATA_FOLDER), *job_key[2:])
+    if JOB_CACHE_ENABLED and data_path.exists():
+        result = job_cache.get(job_result_key(job_key, data_path))
+        if (
+            result is not None
+            and (Path(DATA_FOLDER) / predictions_file_name(trips_params)).exists()
+        ):
+            return jsonify(result)
+
     trips = read_trips(
         data_folder=Path(DATA_FOLDER),
         color=trips_params["color"],
         year=trips_params["year"],
         month=trips_params["month"],
+        columns=TRIP_COLS,
     )
     trips = process_trips(trips, trips_params)
+    ride_ids = build_ride_ids(trips.index, trips_params)
 
-    trips["pred"] = predict(trips[FEATURE_COLS])
+    # One feature pass per request, shared by the served and shadow models.
+    batch = FeatureBatch(shadow_features(trips) if shadow_models else trips)
+    if choose_variant(job_key, challenger, AB_TRAFFIC_SHARE):
+        served_model = challenger
+        y_pred = shadow_models[challenger](batch)
+    else:
+        served_model = PRIMARY_MODEL
+        y_pred = score_primary(batch)
 
     result = {
-        "y_pred_mean": trips["pred"].mean(),
-        "y_pred_std": trips["pred"].std(),
+        "y_pred_mean": float(y_pred.mean()),
+        "y_pred_std": float(y_pred.std(ddof=1)),
+        "model": served_model,
     }
 
-    save_predictions(trips[["ride_id", "pred"]], Path(DATA_FOLDER), trips_params)
+    save_predictions(
+        ride_ids, y_pred, Path(DATA_FOLDER), trips_params, model_name=served_model
+    )
+    if shadow_models:
+        submit_shadows(batch, ride_ids, trips_params, served_model)
+
+    if JOB_CACHE_ENABLED:
+        job_cache.set(job_result_key(job_key, data_path), result)
     return jsonify(result)
 
 
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_endpoint():
+    return jsonify({"features": prediction_cache.stats(), "jobs": job_cache.stats()})
+
+
+@app.route("/shadow/stats", methods=["GET"])
+def shadow_stats_endpoint():
+    return jsonify(shadow_runner.stats())
+
+
 if __name__ == "__main__":
     serve(app, host="0.0.0.0", port=9696)
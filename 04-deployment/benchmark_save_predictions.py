@@ -0,0 +1,81 @@
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import typer
+from app import build_ride_ids, save_predictions
+
+app = typer.Typer()
+
+
+def save_predictions_pandas(
+    index: pd.Index, y_pred: np.ndarray, data_folder: Path, trips_params: dict
+) -> None:
+    trips = pd.DataFrame({"pred": y_pred}, index=index)
+    trips["ride_id"] = f'{trips_params["year"]:>04}/{trips_params["month"]:>02}_' + (
+        trips.index.astype("str")
+    )
+    file_name = (
+        f'{trips_params["color"]}_tripdata_{trips_params["year"]}_'
+        f'{trips_params["month"]}_preds.parquet'
+    )
+    trips[["ride_id", "pred"]].to_parquet(
+        data_folder / file_name, engine="pyarrow", compression=None, index=False
+    )
+
+
+def time_writer(writer: Callable[[Path], None], repeats: int) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as data_folder:
+            data_folder = Path(data_folder)
+            start = time.perf_counter()
+            writer(data_folder)
+            timings.append(time.perf_counter() - start)
+            file_size = sum(f.stat().st_size for f in data_folder.iterdir())
+    return min(timings), file_size
+
+
+@app.command()
+def benchmark(
+    n_rows: int = 3_000_000,
+    repeats: int = 3,
+    row_group_size: Optional[int] = None,
+) -> None:
+    trips_params = {"color": "yellow", "year": "2022", "month": "2"}
+    rng = np.random.default_rng(42)
+    # Filtering outliers leaves gaps in the index, as in the real data.
+    index = pd.Index(np.sort(rng.choice(n_rows * 2, size=n_rows, replace=False)))
+    y_pred = rng.uniform(1, 60, size=n_rows)
+
+    writers = {
+        "pandas (baseline)": lambda folder: save_predictions_pandas(
+            index, y_pred, folder, trips_params
+        ),
+    }
+    for compression in [None, "snappy", "zstd"]:
+        writers[f"arrow ({compression})"] = lambda folder, compression=compression: (
+            save_predictions(
+                build_ride_ids(index, trips_params),
+                y_pred,
+                folder,
+                trips_params,
+                compression=compression,
+                row_group_size=row_group_size,
+            )
+        )
+
+    print(f"{'writer':<20}{'seconds':>10}{'rows/s':>15}{'MiB':>10}")
+    for name, writer in writers.items():
+        seconds, file_size = time_writer(writer, repeats)
+        print(
+            f"{name:<20}{seconds:>10.3f}{n_rows / seconds:>15,.0f}"
+            f"{file_size / 2**20:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,272 @@
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+import typer
+
+app = typer.Typer()
+
+Sender = Callable[[dict], None]
+Result = tuple[float, Optional[str]]
+
+
+def read_payloads(requests_file: Path) -> list[dict]:
+    with open(requests_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_payloads(
+    n_payloads: int, colors: list[str], years: list[str], months: list[str], seed: int
+) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "color": rng.choice(colors),
+            "year": rng.choice(years),
+            "month": rng.choice(months),
+        }
+        for _ in range(n_payloads)
+    ]
+
+
+def write_stub_trips(
+    data_folder: Path, payloads: list[dict], n_rows: int, seed: int
+) -> None:
+    # Stubs follow the yellow trips schema (tpep_* columns), the only one the
+    # service processes.
+    data_folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    jobs = {(p["color"], p["year"], p["month"]) for p in payloads}
+    for color, year, month in jobs:
+        pickup = pd.Timestamp(f"{year}-{month:>02}-01") + pd.to_timedelta(
+            rng.integers(0, 28 * 24 * 60, size=n_rows), unit="min"
+        )
+        dropoff = pickup + pd.to_timedelta(rng.integers(0, 70, size=n_rows), unit="min")
+        location_ids = rng.integers(1, 266, size=(2, n_rows)).astype("float")
+        location_ids[rng.random(size=(2, n_rows)) < 0.01] = np.nan
+
+        trips = pd.DataFrame(
+            {
+                "tpep_pickup_datetime": pickup,
+                "tpep_dropoff_datetime": dropoff,
+                "PULocationID": location_ids[0],
+                "DOLocationID": location_ids[1],
+                "trip_distance": rng.exponential(3.0, size=n_rows),
+            }
+        )
+        trips.to_parquet(
+            data_folder / f"{color}_tripdata_{year}-{month:>02}.parquet", index=False
+        )
+
+
+def create_http_sender(url: str, timeout: float) -> Sender:
+    sessions = threading.local()
+
+    def send(payload: dict) -> None:
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        response = sessions.session.post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+
+    return send
+
+
+def create_local_sender(data_folder: Path, job_cache: bool = True) -> Sender:
+    import app as service
+
+    service.DATA_FOLDER = str(data_folder)
+    service.JOB_CACHE_ENABLED = job_cache
+    clients = threading.local()
+
+    def send(payload: dict) -> None:
+        if not hasattr(clients, "client"):
+            clients.client = service.app.test_client()
+        response = clients.client.post("/predict", json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+    return send
+
+
+def timed_send(send: Sender, payload: dict, scheduled: float) -> Result:
+    # Latency is measured from the scheduled start, so that time spent waiting
+    # for a free worker in open-loop mode is not hidden.
+    try:
+        send(payload)
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return time.perf_counter() - scheduled, error
+
+
+def run_closed_loop(
+    send: Sender, payloads: list[dict], concurrency: int, duration: float
+) -> list[Result]:
+    results = []
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def worker() -> None:
+        while time.perf_counter() < deadline:
+            payload = payloads[next(counter) % len(payloads)]
+            results.append(timed_send(send, payload, time.perf_counter()))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def run_open_loop(
+    send: Sender,
+    payloads: list[dict],
+    concurrency: int,
+    duration: float,
+    rate: float,
+    seed: int,
+) -> list[Result]:
+    rng = random.Random(seed)
+    futures = []
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = scheduled = time.perf_counter()
+        for payload in itertools.cycle(payloads):
+            if scheduled >= start + duration:
+                break
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            futures.append(executor.submit(timed_send, send, payload, scheduled))
+            scheduled += rng.expovariate(rate)
+
+    return [future.result() for future in futures]
+
+
+def summarize(results: list[Result], elapsed: float) -> dict:
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    n_errors = sum(error is not None for _, error in results)
+    p50, p90, p99 = (
+        np.percentile(latencies, [50, 90, 99]) if len(latencies) else (np.nan,) * 3
+    )
+
+    return {
+        "requests": len(results),
+        "errors": n_errors,
+        "error_rate": n_errors / len(results) if results else 0.0,
+        "throughput": len(results) / elapsed,
+        "p50_ms": p50,
+        "p90_ms": p90,
+        "p99_ms": p99,
+        "max_ms": latencies.max() if len(latencies) else np.nan,
+    }
+
+
+@app.command()
+def stub_data(
+    data_folder: Path = Path("data"),
+    requests_file: Optional[Path] = None,
+    n_rows: int = 10_000,
+    seed: int = 42,
+) -> None:
+    payloads = (
+        read_payloads(requests_file)
+        if requests_file
+        else synthetic_payloads(1, ["yellow"], ["2022"], ["2"], seed)
+    )
+    write_stub_trips(data_folder, payloads, n_rows, seed)
+
+
+@app.command()
+def run(
+    url: str = "http://localhost:9696/predict",
+    local: bool = typer.Option(False, help="Call the Flask app in-process."),
+    requests_file: Optional[Path] = None,
+    n_payloads: int = 100,
+    colors: str = "yellow",
+    years: str = "2022",
+    months: str = "1,2,3",
+    stub_rows: int = typer.Option(
+        10_000, help="Rows per stubbed month in local mode, 0 to use real data."
+    ),
+    concurrency: int = 4,
+    duration: float = 30.0,
+    rate: Optional[float] = typer.Option(
+        None, help="Open-loop arrival rate (req/s). Closed loop if not set."
+    ),
+    job_cache: bool = typer.Option(
+        True,
+        help="Serve repeated jobs from the job cache in local mode. Set "
+        "JOB_CACHE_ENABLED=0 on the server to bypass it over HTTP.",
+    ),
+    timeout: float = 60.0,
+    seed: int = 42,
+    max_p99_ms: Optional[float] = None,
+    max_error_rate: Optional[float] = None,
+    min_throughput: Optional[float] = None,
+) -> None:
+    if requests_file:
+        payloads = read_payloads(requests_file)
+    else:
+        payloads = synthetic_payloads(
+            n_payloads, colors.split(","), years.split(","), months.split(","), seed
+        )
+
+    with tempfile.TemporaryDirectory() as stub_folder:
+        if not local:
+            send = create_http_sender(url, timeout)
+        elif stub_rows:
+            write_stub_trips(Path(stub_folder), payloads, stub_rows, seed)
+            send = create_local_sender(Path(stub_folder), job_cache)
+        else:
+            send = create_local_sender(Path("data"), job_cache)
+
+        start = time.perf_counter()
+        if rate:
+            results = run_open_loop(send, payloads, concurrency, duration, rate, seed)
+        else:
+            results = run_closed_loop(send, payloads, concurrency, duration)
+        summary = summarize(results, time.perf_counter() - start)
+
+    print(
+        f"requests: {summary['requests']}, errors: {summary['errors']} "
+        f"({summary['error_rate']:.2%}), throughput: {summary['throughput']:.2f} req/s"
+    )
+    print(
+        f"latency ms p50: {summary['p50_ms']:.1f}, p90: {summary['p90_ms']:.1f}, "
+        f"p99: {summary['p99_ms']:.1f}, max: {summary['max_ms']:.1f}"
+    )
+
+    failed_gates = [
+        name
+        for name, failed in [
+            ("no completed requests", summary["requests"] == 0),
+            ("p99 latency", max_p99_ms is not None and summary["p99_ms"] > max_p99_ms),
+            (
+                "error rate",
+                max_error_rate is not None and summary["error_rate"] > max_error_rate,
+            ),
+            (
+                "throughput",
+                min_throughput is not None and summary["throughput"] < min_throughput,
+            ),
+        ]
+        if failed
+    ]
+    if failed_gates:
+        print(f"Failed gates: {', '.join(failed_gates)}")
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
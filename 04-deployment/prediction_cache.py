@@ -0,0 +1,177 @@
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Iterable, Optional
+
+SQLITE_BATCH_SIZE = 500
+
+
+class SQLiteBackend:
+    # Rows are dropped when they expire, beyond max_rows (oldest first) and
+    # when another model version is loaded, so that the file stays bounded.
+    def __init__(self, path: Path, table: str, max_rows: int):
+        self.table = table
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}("
+            "key TEXT PRIMARY KEY, version TEXT, value BLOB, expires_at REAL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table}(expires_at)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start : start + SQLITE_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(batch))}) "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    [*batch, time.time()],
+                )
+                found.update((key, pickle.loads(value)) for key, value in rows)
+        return found
+
+    def set_many(
+        self, items: dict[str, tuple[str, Any]], expires_at: Optional[float]
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at <= ?", [time.time()]
+            )
+            # INSERT OR REPLACE assigns a new rowid, so rowids follow the
+            # order of the last write.
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                [
+                    (key, version, pickle.dumps(value), expires_at)
+                    for key, (version, value) in items.items()
+                ],
+            )
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ("
+                f"SELECT rowid FROM {self.table} ORDER BY rowid "
+                f"LIMIT max(0, (SELECT count(*) FROM {self.table}) - ?))",
+                [self.max_rows],
+            )
+            self._conn.commit()
+
+    def purge_versions(self, keep_version: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE version != ?", [keep_version]
+            )
+            self._conn.commit()
+
+
+# In-process LRU cache with optional TTL. With backend_path set, entries are
+# also written to a SQLite file shared by all waitress processes on the host,
+# in the given table. Keys are tuples starting with the model version.
+class PredictionCache:
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[float] = None,
+        backend_path: Optional[Path] = None,
+        backend_table: str = "predictions",
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[
+            Hashable, tuple[Optional[float], Any]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend = (
+            SQLiteBackend(backend_path, backend_table, max_entries)
+            if backend_path
+            else None
+        )
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+    def _store(self, key: Hashable, value: Any, expires_at: Optional[float]) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys: Iterable[Hashable]) -> dict[Hashable, Any]:
+        keys = list(keys)
+        found = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and (entry[0] is None or entry[0] > now):
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    missing.append(key)
+
+        if self._backend and missing:
+            shared = self._backend.get_many([repr(key) for key in missing])
+            expires_at = self._expires_at()
+            with self._lock:
+                for key in missing:
+                    if repr(key) in shared:
+                        found[key] = shared[repr(key)]
+                        self._store(key, found[key], expires_at)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: dict[Hashable, Any]) -> None:
+        expires_at = self._expires_at()
+        with self._lock:
+            for key, value in items.items():
+                self._store(key, value, expires_at)
+        if self._backend:
+            self._backend.set_many(
+                {repr(key): (key[0], value) for key, value in items.items()},
+                expires_at,
+            )
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.set_many({key: value})
+
+    def invalidate(self, keep_version: Optional[str] = None) -> None:
+        # Shared entries of other versions are dropped as well if keep_version
+        # is given. Other processes still on an older model only miss.
+        with self._lock:
+            self._entries.clear()
+        if self._backend and keep_version is not None:
+            self._backend.purge_versions(keep_version)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            memory_bytes = sys.getsizeof(self._entries) + sum(
+                sys.getsizeof(key) + sys.getsizeof(value)
+                for key, (_, value) in self._entries.items()
+            )
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "entries": len(self._entries),
+                "memory_bytes": memory_bytes,
+            }
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+
+
+class FeatureBatch:
+    # The feature columns of all models for one request. The records are built
+    # once, on first use, and shared by every model that scores the batch.
+    def __init__(self, features: pd.DataFrame):
+        self.features = features
+        self._records: Optional[list[dict]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def records(self) -> list[dict]:
+        with self._lock:
+            if self._records is None:
+                self._records = self.features.to_dict(orient="records")
+            return self._records
+
+
+Scorer = Callable[[FeatureBatch], np.ndarray]
+
+
+def load_scorer(path: str) -> Scorer:
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+
+    if isinstance(model, Pipeline):
+        # Pipelines from src.create_pipeline start with a DictTransformer, which
+        # is skipped here because the batch already holds the records.
+        steps = model[1:] if model.steps[0][0] == "dict_transformer" else model
+        return lambda batch: steps.predict(batch.records)
+
+    dv, predictor = model
+    return lambda batch: predictor.predict(dv.transform(batch.records))
+
+
+def parse_shadow_models(config: str) -> dict[str, Scorer]:
+    # config is a comma-separated list of name=path pairs.
+    scorers = {}
+    for entry in filter(None, config.split(",")):
+        name, path = entry.split("=", 1)
+        scorers[name.strip()] = load_scorer(path.strip())
+    return scorers
+
+
+def choose_variant(job_key: tuple, challenger: Optional[str], share: float) -> bool:
+    # Deterministic, so that a repeated job is always served by the same model.
+    if challenger is None or share <= 0:
+        return False
+    digest = hashlib.sha256(repr(job_key).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 < share
+
+
+class ShadowRunner:
+    # At most max_pending jobs are queued or running. Further jobs are dropped
+    # and counted, so that slow shadow models cannot pile up batches in memory.
+    def __init__(self, max_workers: int = 1, max_pending: int = 4):
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="shadow-scoring"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "dropped": 0, "failed": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def submit(
+        self,
+        scorers: dict[str, Scorer],
+        batch: FeatureBatch,
+        on_result: Callable[[str, np.ndarray], None],
+    ) -> Optional[Future]:
+        if not self._slots.acquire(blocking=False):
+            self._count("dropped")
+            logging.warning("Shadow scoring queue is full, dropping the job.")
+            return None
+
+        self._count("submitted")
+        future = self._executor.submit(self._run, scorers, batch, on_result)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        if future.exception() is not None:
+            self._count("failed")
+            logging.error("Shadow scoring failed.", exc_info=future.exception())
+
+    def _run(
+        self,
+        scorers: dict[str, Scorer],
+        batch: FeatureBatch,
+        on_result: Callable[[str, np.ndarray], None],
+    ) -> None:
+        for name, scorer in scorers.items():
+            start = time.perf_counter()
+            try:
+                y_pred = scorer(batch)
+                on_result(name, y_pred)
+            except Exception:
+                self._count("failed")
+                logging.exception(f"Shadow model {name} failed.")
+                continue
+            logging.info(
+                f"Shadow model {name}: {len(y_pred)} predictions in "
+                f"{time.perf_counter() - start:.3f}s, mean {y_pred.mean():.2f}"
+            )
@@ -1,10 +1,15 @@
+import hashlib
 import logging
-import pickle
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
+from uuid import uuid4
 
+import numpy as np
 import pandas as pd
 import psycopg
 from evidently import ColumnMapping
@@ -12,30 +17,86 @@ from evidently.metrics import (ColumnDriftMetric, ColumnQuantileMetric,
                                DatasetCorrelationsMetric, DatasetDriftMetric,
                                DatasetMissingValuesMetric)
 from evidently.report import Report
+from monitoring_config import (CATEGORICAL_COLS, DATA_FOLDER, MODEL_FOLDER,
+                               NUMERICAL_COLS, read_model)
 from prefect import flow, task
+from reference_profile import read_reference_profile
 
-from src import read_trips
+from src import download_trips, read_compact_trips, to_location_ids
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
 )
 
 SEND_TIMEOUT = 10
-DATA_FOLDER = Path("../data")
-MODEL_FOLDER = Path("../models")
+PREDICTION_FOLDER = DATA_FOLDER / "predictions"
+PREDICTION_CHUNK_SIZE = 500_000
 
-TARGET = "duration"
-CATEGORICAL_COLS = ["PULocationID", "DOLocationID"]
-NUMERICAL_COLS = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
 
-
-def read_reference_data():
+def read_reference_data() -> pd.DataFrame:
+    profile_path = DATA_FOLDER / "reference_profile.parquet"
+    if profile_path.exists():
+        return read_reference_profile(profile_path)["sample"]
     return pd.read_parquet(DATA_FOLDER / "reference_data.parquet")
 
 
-def read_model():
+def hash_model() -> str:
     with open(MODEL_FOLDER / "model.pkl", "rb") as f:
-        return pickle.load(f)
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def predict_in_chunks(model: Any, features: pd.DataFrame) -> np.ndarray:
+    return np.concatenate(
+        [
+            model.predict(features.iloc[start : start + PREDICTION_CHUNK_SIZE])
+            for start in range(0, len(features), PREDICTION_CHUNK_SIZE)
+        ]
+        or [np.empty(0)]
+    )
+
+
+def prediction_key(trips_path: Path) -> str:
+    # Predictions depend on the model and on the trips file they were made for.
+    stat = trips_path.stat()
+    key = f"{hash_model()}:{trips_path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def predict_month(new_data: pd.DataFrame, trips_path: Path) -> np.ndarray:
+    prediction_path = (
+        PREDICTION_FOLDER / f"{trips_path.stem}_{prediction_key(trips_path)}.parquet"
+    )
+    if prediction_path.exists():
+        predictions = pd.read_parquet(prediction_path)["prediction"].to_numpy()
+        if len(predictions) == len(new_data):
+            return predictions
+
+    predictions = predict_in_chunks(
+        read_model(), new_data[NUMERICAL_COLS + CATEGORICAL_COLS].fillna(0)
+    )
+    # Written to a temporary file first, so that an interrupted run never
+    # leaves a partial file behind under the final name.
+    PREDICTION_FOLDER.mkdir(parents=True, exist_ok=True)
+    tmp_path = prediction_path.with_name(f"{prediction_path.name}.{uuid4().hex}.tmp")
+    pd.DataFrame({"prediction": predictions}).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, prediction_path)
+
+    return predictions
+
+
+def split_by_date(
+    new_data: pd.DataFrame, date_col: str
+) -> tuple[list, list[pd.DataFrame]]:
+    # Expects new_data sorted by date_col, so that each day is a contiguous
+    # block which can be sliced positionally without a boolean mask.
+    pickup_dates = new_data[date_col].dt.normalize().to_numpy()
+    dates, offsets = np.unique(pickup_dates, return_index=True)
+    offsets = np.append(offsets, len(new_data))
+
+    return (
+        [pd.Timestamp(date).date() for date in dates],
+        [new_data.iloc[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])],
+    )
 
 
 def crate_column_mapping() -> ColumnMapping:
@@ -77,12 +138,7 @@ def create_table() -> None:
     ) as conn:
         conn.execute(CREATE_TABLE_STATEMENT)
 
-def get_metrics(
-    reference_data: pd.DataFrame, new_data: pd.DataFrame, model: Any
-) -> dict:
-    new_data["prediction"] = model.predict(
-        new_data[NUMERICAL_COLS + CATEGORICAL_COLS].fillna(0)
-    )
+def get_metrics(reference_data: pd.DataFrame, new_data: pd.DataFrame) -> dict:
     column_mapping = crate_column_mapping()
     report = create_report()
 
@@ -112,6 +168,29 @@ def get_metrics(
     }
 
 
+# Reference data of the current (worker) process, loaded once by
+# init_metrics_worker so that it is not pickled along with every day.
+_worker_state: dict[str, Any] = {}
+
+
+def init_metrics_worker() -> None:
+    _worker_state["reference_data"] = read_reference_data()
+
+
+def get_daily_metrics(new_data: pd.DataFrame) -> dict:
+    return get_metrics(_worker_state["reference_data"], new_data)
+
+
+def wait_for_next_send(last_send: datetime) -> datetime:
+    new_send = datetime.now()
+    seconds_elapsed = (new_send - last_send).total_seconds()
+    if seconds_elapsed < SEND_TIMEOUT:
+        time.sleep(SEND_TIMEOUT - seconds_elapsed)
+    while last_send < new_send:
+        last_send = last_send + timedelta(seconds=SEND_TIMEOUT)
+    return last_send
+
+
 @task(retries=3, retry_delay_seconds=5, name="prepare database")
 def prep_db():
     with psycopg.connect(
@@ -147,13 +226,25 @@ def export_metrics_postgresql(cursor, metrics: dict) -> None:
 
 
 @flow
-def batch_monitoring_backfill(color="green", year="2023", month="3"):
+def batch_monitoring_backfill(
+    color: str = "green",
+    year: str = "2023",
+    month: str = "3",
+    parallel: bool = False,
+    max_workers: Optional[int] = None,
+    pacing: bool = True,
+):
     prep_db()
-    last_send = datetime.now() - timedelta(seconds=10)
+    last_send = datetime.now() - timedelta(seconds=SEND_TIMEOUT)
 
-    reference_data = read_reference_data()
-    model = read_model()
-    new_data = read_trips(DATA_FOLDER, color, year, month)
+    trips_path = download_trips(DATA_FOLDER, color, year, month)
+    new_data = read_compact_trips(
+        trips_path, columns=NUMERICAL_COLS + CATEGORICAL_COLS + ["pickup_datetime"]
+    )
+    # The monitoring model and the reference data use the zone numbers.
+    new_data = new_data.assign(
+        **{col: to_location_ids(new_data[col]) for col in CATEGORICAL_COLS}
+    )
 
     new_data = new_data[
         (new_data["lpep_pickup_datetime"] >= datetime(int(year), int(month), 1, 0, 0))
@@ -162,25 +253,34 @@ def batch_monitoring_backfill(color="green", year="2023", month="3"):
             <= datetime(int(year), int(month) + 1, 1, 0, 0) - timedelta(days=1)
         )
     ]
-    dates = sorted(new_data["lpep_pickup_datetime"].dt.date.unique())
+    new_data = new_data.sort_values("lpep_pickup_datetime", kind="stable")
+    new_data = new_data.assign(prediction=predict_month(new_data, trips_path))
+    dates, daily_data = split_by_date(new_data, "lpep_pickup_datetime")
 
-    with psycopg.connect(
-        "host=localhost port=5432 dbname=test user=postgres password=postgres",
-        autocommit=True,
-    ) as conn:
-        for date in dates:
-            new_data_date = new_data[new_data["lpep_pickup_datetime"].dt.date == date]
-            metrics = get_metrics(reference_data, new_data_date, model)
+    with ExitStack() as stack:
+        conn = stack.enter_context(
+            psycopg.connect(
+                "host=localhost port=5432 dbname=test user=postgres password=postgres",
+                autocommit=True,
+            )
+        )
+        if parallel:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(max_workers, initializer=init_metrics_worker)
+            )
+            # map yields the results in date order, as soon as each one is ready.
+            daily_metrics = executor.map(get_daily_metrics, daily_data)
+        else:
+            init_metrics_worker()
+            daily_metrics = map(get_daily_metrics, daily_data)
+
+        for date, metrics in zip(dates, daily_metrics):
             metrics["timestamp"] = date
             with conn.cursor() as cursor:
                 export_metrics_postgresql(cursor, metrics)
 
-            new_send = datetime.now()
-            seconds_elapsed = (new_send - last_send).total_seconds()
-            if seconds_elapsed < SEND_TIMEOUT:
-                time.sleep(SEND_TIMEOUT - seconds_elapsed)
-            while last_send < new_send:
-                last_send = last_send + timedelta(seconds=10)
+            if pacing:
+                last_send = wait_for_next_send(last_send)
             logging.info("data sent")
 
 
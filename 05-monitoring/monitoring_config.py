@@ -0,0 +1,14 @@
+import pickle
+from pathlib import Path
+
+DATA_FOLDER = Path("../data")
+MODEL_FOLDER = Path("../models")
+
+TARGET = "duration"
+CATEGORICAL_COLS = ["PULocationID", "DOLocationID"]
+NUMERICAL_COLS = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
+
+
+def read_model():
+    with open(MODEL_FOLDER / "model.pkl", "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,139 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import typer
+from monitoring_config import CATEGORICAL_COLS, DATA_FOLDER, NUMERICAL_COLS, read_model
+
+from src import read_trips, to_location_ids
+
+PROFILE_METADATA_KEY = b"reference_profile"
+PROFILE_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+RANDOM_STATE = 42
+# homework.ipynb fits the monitoring model on the first rows of the month and
+# keeps the rest as reference data.
+TRAINING_ROWS = 30_000
+
+app = typer.Typer()
+
+
+def process_reference_trips(trips: pd.DataFrame, used_cols: list[str]) -> pd.DataFrame:
+    try:
+        pickup_col = [col for col in trips.columns if col.endswith("pickup_datetime")][
+            0
+        ]
+        dropoff_col = [
+            col for col in trips.columns if col.endswith("dropoff_datetime")
+        ][0]
+    except IndexError:
+        raise ValueError("Could not find pickup and dropoff columns.")
+    duration = (trips[dropoff_col] - trips[pickup_col]).dt.total_seconds() / 60
+
+    duration_outliers_mask = (duration >= 0) & (duration <= 60)
+    passenger_count_outliers_mask = (trips["passenger_count"] > 0) & (
+        trips["passenger_count"] <= 8
+    )
+
+    return trips.loc[duration_outliers_mask & passenger_count_outliers_mask, used_cols]
+
+
+def stratified_sample(
+    data: pd.DataFrame, size: int, strata_col: str, random_state: int = RANDOM_STATE
+) -> pd.DataFrame:
+    if len(data) <= size:
+        return data
+
+    # Proportional allocation with at least one row per stratum, so that rare
+    # zones are still represented. The sample can thus be slightly larger than
+    # size.
+    shuffled = data.sample(frac=1, random_state=random_state)
+    strata, _ = pd.factorize(shuffled[strata_col])
+    strata_sizes = np.bincount(strata + 1)[strata + 1]
+    quota = np.maximum(1, np.round(strata_sizes * size / len(data)))
+    rank = shuffled.groupby(strata).cumcount().to_numpy()
+
+    return shuffled[rank < quota].sort_index()
+
+
+def build_reference_profile(data: pd.DataFrame, sample: pd.DataFrame) -> dict[str, Any]:
+    return {"sample": sample, "num_rows": len(data)}
+
+
+def profile_fidelity(
+    data: pd.DataFrame, sample: pd.DataFrame, numerical_cols: list[str]
+) -> dict[str, float]:
+    # Largest gap between the sample and full-data quantiles, relative to the
+    # interquartile range of the full data.
+    fidelity = {}
+    for col in numerical_cols:
+        values = data[col].dropna()
+        full = np.quantile(values, PROFILE_QUANTILES)
+        sampled = np.quantile(sample[col].dropna(), PROFILE_QUANTILES)
+        iqr = np.subtract(*np.quantile(values, [0.75, 0.25]))
+        fidelity[col] = float(np.max(np.abs(sampled - full)) / (iqr or 1.0))
+    return fidelity
+
+
+def save_reference_profile(profile: dict[str, Any], path: Path) -> None:
+    sample = pa.Table.from_pandas(profile["sample"], preserve_index=False)
+    summary = {key: value for key, value in profile.items() if key != "sample"}
+    sample = sample.replace_schema_metadata(
+        {
+            **(sample.schema.metadata or {}),
+            PROFILE_METADATA_KEY: json.dumps(summary).encode(),
+        }
+    )
+    pq.write_table(sample, path, compression="zstd")
+
+
+def read_reference_profile(path: Path) -> dict[str, Any]:
+    sample = pq.read_table(path)
+    summary = json.loads(sample.schema.metadata[PROFILE_METADATA_KEY])
+    return {"sample": sample.to_pandas(), **summary}
+
+
+@app.command()
+def build(
+    color: str = "green",
+    year: str = "2022",
+    month: str = "1",
+    size: int = 5000,
+    strata_col: str = "PULocationID",
+    output_name: str = "reference_profile.parquet",
+    training_rows: int = TRAINING_ROWS,
+) -> None:
+    used_cols = NUMERICAL_COLS + CATEGORICAL_COLS
+    trips = read_trips(
+        DATA_FOLDER,
+        color,
+        year,
+        month,
+        columns=used_cols + ["pickup_datetime", "dropoff_datetime"],
+    )
+    trips = process_reference_trips(trips, used_cols)
+    trips = trips.assign(
+        **{col: to_location_ids(trips[col]) for col in CATEGORICAL_COLS}
+    )
+    # Only the held-out rows, so that the predictions are out of sample as in
+    # reference_data.parquet.
+    trips = trips.iloc[training_rows:]
+
+    model = read_model()
+    trips = trips.assign(prediction=model.predict(trips[used_cols].fillna(0)))
+    sample = stratified_sample(trips, size, strata_col)
+
+    profile = build_reference_profile(trips, sample)
+    save_reference_profile(profile, DATA_FOLDER / output_name)
+
+    print(f"Sampled {len(sample)} of {len(trips)} rows.")
+    fidelity = profile_fidelity(trips, sample, NUMERICAL_COLS + ["prediction"])
+    for col, gap in fidelity.items():
+        print(f"{col}: largest quantile gap {gap:.3f} IQR")
+
+
+if __name__ == "__main__":
+    app()
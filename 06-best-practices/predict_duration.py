@@ -2,7 +2,15 @@ import pickle
 import sys
 from typing import Any, Optional
 
+import fsspec
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# "-1" for missing locations and the TLC zones 1-265, as in src/schema.py.
+LOCATION_DTYPE = pd.CategoricalDtype(["-1", *map(str, range(1, 266))])
 
 with open("model.bin", "rb") as f_in:
     dv, lr = pickle.load(f_in)
@@ -19,7 +27,10 @@ def prepare_data(df: pd.DataFrame, categorical: list[str]) -> pd.DataFrame:
 
     df = df[(df["duration"] >= 1) & (df["duration"] <= 60)].copy()
 
-    df[categorical] = df[categorical].fillna(-1).astype("int").astype("str")
+    for col in categorical:
+        ids = df[col].fillna(-1).to_numpy(dtype="int16")
+        codes = np.where((ids >= 1) & (ids <= 265), ids, 0)
+        df[col] = pd.Categorical.from_codes(codes, dtype=LOCATION_DTYPE)
 
     return df
 
@@ -36,8 +47,30 @@ def make_predictions(df: pd.DataFrame, categorical: list[str]) -> pd.Series:
 def export_data(
     df: pd.DataFrame, output_path: str, options: Optional[dict[str, Any]]
 ) -> None:
-    df.to_parquet(
-        output_path, engine="pyarrow", index=False, storage_options=options
+    df.to_parquet(output_path, engine="pyarrow", index=False, storage_options=options)
+
+
+def build_ride_ids(year: int, month: int, index: pd.Index) -> pa.Array:
+    rows = pc.cast(pa.array(index.to_numpy()), pa.string())
+    return pc.binary_join_element_wise(f"{year:04d}/{month:02d}_", rows, "")
+
+
+def export_predictions(
+    ride_ids: pa.Array,
+    y_pred: np.ndarray,
+    output_path: str,
+    options: Optional[dict[str, Any]] = None,
+    compression: Optional[str] = "snappy",
+    row_group_size: Optional[int] = None,
+) -> None:
+    predictions = pa.table({"ride_id": ride_ids, "predicted_duration": y_pred})
+    fs, path = fsspec.core.url_to_fs(output_path, **(options or {}))
+    pq.write_table(
+        predictions,
+        path,
+        filesystem=fs,
+        compression=compression,
+        row_group_size=row_group_size,
     )
 
 
@@ -48,11 +81,9 @@ def predict_duration(
 
     df = read_data(year, month)
     df = prepare_data(df, categorical=categorical)
-    df["ride_id"] = f"{year:04d}/{month:02d}_" + df.index.astype("str")
-
-    df["predicted_duration"] = make_predictions(df, categorical=categorical)
+    y_pred = make_predictions(df, categorical=categorical)
 
-    export_data(df[["ride_id", "predicted_duration"]], output_file)
+    export_predictions(build_ride_ids(year, month, df.index), y_pred, output_file)
 
 
 if __name__ == "__main__":
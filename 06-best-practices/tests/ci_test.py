@@ -2,7 +2,13 @@ from datetime import datetime
 
 import pandas as pd
 import pytest
-from predict_duration import export_data, make_predictions, prepare_data
+from predict_duration import (
+    build_ride_ids,
+    export_data,
+    export_predictions,
+    make_predictions,
+    prepare_data,
+)
 
 AWS_ENDPOINT_URL = "http://localstack:4566"
 CATEGORICAL_COLS = ["PULocationID", "DOLocationID"]
@@ -46,4 +52,22 @@ def test_export_data(trips: pd.DataFrame):
     output_path = "s3://nyc-duration/trips.parquet"
     options = {"client_kwargs": {"endpoint_url": AWS_ENDPOINT_URL}}
     export_data(trips, output_path, options=options)
-    
\ No newline at end of file
+
+
+def test_build_ride_ids(trips):
+    trips = prepare_data(trips, categorical=CATEGORICAL_COLS)
+    ride_ids = build_ride_ids(2022, 1, trips.index)
+    assert ride_ids.to_pylist() == ["2022/01_0", "2022/01_1", "2022/01_2"]
+
+
+def test_export_predictions(trips, tmp_path):
+    trips = prepare_data(trips, categorical=CATEGORICAL_COLS)
+    ride_ids = build_ride_ids(2022, 1, trips.index)
+    y_pred = make_predictions(trips, categorical=CATEGORICAL_COLS)
+
+    output_path = tmp_path / "trips.parquet"
+    export_predictions(ride_ids, y_pred, str(output_path))
+
+    predictions = pd.read_parquet(output_path)
+    assert predictions.columns.tolist() == ["ride_id", "predicted_duration"]
+    assert predictions["ride_id"].tolist() == ride_ids.to_pylist()
@@ -1,13 +1,23 @@
 from .create_model import create_pipeline
-from .load_data import read_trips
-from .preprocess import process_trips
+from .intermediate import read_intermediate, release_intermediate, write_intermediate
+from .load_data import download_trips, read_trips
+from .preprocess import PROCESS_TRIPS_COLS, process_trips
 from .save_model import save_model
+from .schema import read_compact_trips, to_location_category, to_location_ids
 from .train_best_model import train_best_xgbregressor
 
 __all__ = [
+    "PROCESS_TRIPS_COLS",
     "create_pipeline",
+    "download_trips",
     "read_trips",
     "process_trips",
+    "read_compact_trips",
+    "read_intermediate",
+    "release_intermediate",
     "save_model",
+    "to_location_category",
+    "to_location_ids",
     "train_best_xgbregressor",
+    "write_intermediate",
 ]
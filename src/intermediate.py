@@ -0,0 +1,27 @@
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+import pandas as pd
+
+INTERMEDIATE_FOLDER = Path("data") / "intermediate"
+
+
+def write_intermediate(
+    frame: pd.DataFrame, folder: Path = INTERMEDIATE_FOLDER, name: str = "frame"
+) -> Path:
+    folder.mkdir(parents=True, exist_ok=True)
+
+    path = folder / f"{name}_{uuid4().hex}.parquet"
+    frame.to_parquet(path, engine="pyarrow", compression=None, index=False)
+
+    return path
+
+
+def read_intermediate(path: Path, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    return pd.read_parquet(path, engine="pyarrow", columns=columns)
+
+
+def release_intermediate(*paths: Path) -> None:
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
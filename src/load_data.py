@@ -1,12 +1,15 @@
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 import wget
 
+from .schema import read_compact_trips
+
 TLC_TRIP_DATA_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data/"
 
 
-def read_trips(data_folder: Path, color: str, year: str, month: str) -> pd.DataFrame:
+def download_trips(data_folder: Path, color: str, year: str, month: str) -> Path:
     if not data_folder.exists():
         data_folder.mkdir(parents=True, exist_ok=True)
 
@@ -15,4 +18,16 @@ def read_trips(data_folder: Path, color: str, year: str, month: str) -> pd.DataF
         url = f"{TLC_TRIP_DATA_URL}{color}_tripdata_{year}-{month:>02}.parquet"
         wget.download(url, str(data_path))
 
-    return pd.read_parquet(data_path)
+    return data_path
+
+
+def read_trips(
+    data_folder: Path,
+    color: str,
+    year: str,
+    month: str,
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    return read_compact_trips(
+        download_trips(data_folder, color, year, month), columns=columns
+    )
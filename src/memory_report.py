@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from .load_data import download_trips
+from .preprocess import PROCESS_TRIPS_COLS, process_trips
+from .schema import read_compact_trips
+
+TRAINING_COLS = ["PULocationID", "DOLocationID", "PU_DO", "trip_distance", "duration"]
+
+
+def memory_footprint(trips: pd.DataFrame) -> int:
+    return int(trips.memory_usage(index=False, deep=True).sum())
+
+
+def process_trips_legacy(trips: pd.DataFrame) -> pd.DataFrame:
+    # Processing as it was before the compact schema: location IDs and PU_DO
+    # as one Python string per trip.
+    trips = process_trips(trips)
+    trips["PULocationID"] = trips["PULocationID"].astype(str).astype("object")
+    trips["DOLocationID"] = trips["DOLocationID"].astype(str).astype("object")
+    trips["PU_DO"] = trips["PULocationID"] + "_" + trips["DOLocationID"]
+    return trips
+
+
+def memory_report(data_path: Path) -> pd.DataFrame:
+    # Before, the flows read every column of the month. They now read only
+    # the columns that training uses.
+    raw = pd.read_parquet(data_path)
+    compact = read_compact_trips(data_path)
+    compact_training = read_compact_trips(
+        data_path, columns=PROCESS_TRIPS_COLS + TRAINING_COLS
+    )
+
+    raw_processed = process_trips_legacy(raw)[TRAINING_COLS]
+    compact_processed = process_trips(compact_training)[TRAINING_COLS]
+
+    report = pd.DataFrame(
+        {
+            "before_mib": [memory_footprint(raw)] * 2
+            + [memory_footprint(raw_processed)],
+            "after_mib": [
+                memory_footprint(compact),
+                memory_footprint(compact_training),
+                memory_footprint(compact_processed),
+            ],
+        },
+        index=["read (all columns)", "read (training columns)", "processed"],
+    )
+    report = report / 2**20
+    report["reduction"] = report["before_mib"] / report["after_mib"]
+    return report
+
+
+if __name__ == "__main__":
+    data_folder, color, year, month = sys.argv[1:5]
+    data_path = download_trips(Path(data_folder), color, year, month)
+    print(memory_report(data_path).round(2).to_string())
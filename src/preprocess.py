@@ -1,6 +1,16 @@
 import numpy as np
 import pandas as pd
 
+from .schema import combine_locations, to_location_category
+
+# Columns process_trips needs, for read_trips(columns=...).
+PROCESS_TRIPS_COLS = [
+    "pickup_datetime",
+    "dropoff_datetime",
+    "PULocationID",
+    "DOLocationID",
+]
+
 
 def process_trips(trips: pd.DataFrame) -> pd.DataFrame:
     trips = trips.copy()
@@ -14,7 +24,7 @@ def process_trips(trips: pd.DataFrame) -> pd.DataFrame:
     except IndexError:
         raise ValueError("Could not find pickup and dropoff columns.")
     trips["duration"] = trips[dropoff_col] - trips[pickup_col]
-    trips["duration"] = trips["duration"].apply(lambda td: td.total_seconds() / 60)
+    trips["duration"] = trips["duration"].dt.total_seconds() / 60
     print(f"Standard deviation of duration: {np.std(trips['duration']):.2f}")
 
     outliers_mask = (trips["duration"] >= 1) & (trips["duration"] <= 60)
@@ -24,8 +34,8 @@ def process_trips(trips: pd.DataFrame) -> pd.DataFrame:
     )
     trips = trips[outliers_mask]
 
-    trips["PULocationID"] = trips["PULocationID"].astype(str)
-    trips["DOLocationID"] = trips["DOLocationID"].astype(str)
-    trips["PU_DO"] = trips["PULocationID"] + "_" + trips["DOLocationID"]
+    trips["PULocationID"] = to_location_category(trips["PULocationID"])
+    trips["DOLocationID"] = to_location_category(trips["DOLocationID"])
+    trips["PU_DO"] = combine_locations(trips["PULocationID"], trips["DOLocationID"])
 
     return trips
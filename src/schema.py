@@ -0,0 +1,107 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# TLC taxi zones are numbered 1-265. Missing locations are filled with -1 at
+# serving time, so "-1" is a category as well. With this order the category
+# code of a zone is the zone number itself.
+TLC_ZONE_IDS = range(1, 266)
+LOCATION_DTYPE = pd.CategoricalDtype(["-1", *map(str, TLC_ZONE_IDS)])
+LOCATION_COLS = ["PULocationID", "DOLocationID"]
+
+# Columns with nulls in some months (e.g. payment_type of green trips) are
+# float32 rather than small integers, so that they stay numpy-backed. Money
+# columns and trip_distance stay float64: values such as 12.35 are not exact
+# in float32.
+COMPACT_TYPES = {
+    "VendorID": pa.int8(),
+    "passenger_count": pa.float32(),
+    "RatecodeID": pa.float32(),
+    "payment_type": pa.float32(),
+    "trip_type": pa.float32(),
+}
+DICTIONARY_COLS = ["store_and_fwd_flag"]
+
+
+def to_location_category(location_ids: pd.Series) -> pd.Series:
+    if isinstance(location_ids.dtype, pd.CategoricalDtype):
+        return location_ids.astype(LOCATION_DTYPE)
+
+    ids = pd.to_numeric(location_ids, errors="coerce").to_numpy(dtype="float64")
+    known = (ids == -1) | ((ids >= TLC_ZONE_IDS[0]) & (ids <= TLC_ZONE_IDS[-1]))
+    codes = np.where(known, np.maximum(ids, 0), -1).astype("int16")
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype=LOCATION_DTYPE),
+        index=location_ids.index,
+        name=location_ids.name,
+    )
+
+
+def to_location_ids(locations: pd.Series) -> pd.Series:
+    # Inverse of to_location_category, for models that use the zone numbers.
+    codes = locations.cat.codes.astype("float32")
+    return codes.where(codes != -1).replace(0, -1)
+
+
+def combine_locations(pickup: pd.Series, dropoff: pd.Series) -> pd.Series:
+    # Builds "<pickup>_<dropoff>" labels for the distinct pairs only, instead of
+    # concatenating one Python string per trip.
+    labels = np.array([*LOCATION_DTYPE.categories, "nan"], dtype="object")
+    n_labels = len(labels)
+    pickup_codes = np.where(pickup.cat.codes < 0, n_labels - 1, pickup.cat.codes)
+    dropoff_codes = np.where(dropoff.cat.codes < 0, n_labels - 1, dropoff.cat.codes)
+
+    codes, pairs = pd.factorize(pickup_codes.astype("int32") * n_labels + dropoff_codes)
+    categories = labels[pairs // n_labels] + "_" + labels[pairs % n_labels]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories),
+        index=pickup.index,
+    )
+
+
+def compact_table(trips: pa.Table) -> pa.Table:
+    for i, field in enumerate(trips.schema):
+        if field.name in COMPACT_TYPES:
+            # Integer casts fail on out-of-range values, but float casts round
+            # silently, so they are checked by casting back. Either way, a
+            # column that does not fit the compact type is kept as is.
+            try:
+                column = trips.column(i).cast(COMPACT_TYPES[field.name], safe=True)
+            except pa.ArrowInvalid:
+                continue
+            if not column.cast(field.type).equals(trips.column(i)):
+                continue
+        elif field.name in DICTIONARY_COLS:
+            column = pc.dictionary_encode(trips.column(i))
+        else:
+            continue
+        trips = trips.set_column(i, field.name, column)
+    return trips
+
+
+def select_columns(data_path: Path, columns: list[str]) -> list[str]:
+    # "pickup_datetime" and "dropoff_datetime" match the tpep_/lpep_ columns
+    # of either color. Columns missing from the file are skipped.
+    return [
+        name
+        for name in pq.read_schema(data_path).names
+        if any(name == col or name.endswith(f"_{col}") for col in columns)
+    ]
+
+
+def read_compact_trips(
+    data_path: Path, columns: Optional[list[str]] = None
+) -> pd.DataFrame:
+    if columns is not None:
+        columns = select_columns(data_path, columns)
+    trips = pq.read_table(data_path, columns=columns)
+    trips = compact_table(trips).to_pandas(self_destruct=True)
+    for col in LOCATION_COLS:
+        if col in trips.columns:
+            trips[col] = to_location_category(trips[col])
+    return trips